@@ -7,7 +7,9 @@ from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials # 导入这个
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, schemas
 from .database import get_db
 from dotenv import load_dotenv
@@ -42,13 +44,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def create_user(db: AsyncSession, username: str, email: str, hashed_password: str):
+    # INSERT ... ON CONFLICT DO NOTHING：依赖 username/email 的唯一约束，一次往返完成检查和插入
+    # 用户名或邮箱已存在时返回 None
+    stmt = insert(models.User).values(
+        username=username,
+        email=email,
+        hashed_password=hashed_password
+    ).on_conflict_do_nothing().returning(models.User)
+    result = await db.execute(stmt)
+    db_user = result.scalars().first()
+    await db.commit()
+    return db_user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     token = credentials.credentials # 从 credentials 中提取 token 字符串
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,7 +77,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(o
         token_data = schemas.TokenData(username=username, user_id=uuid.UUID(user_id))
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.id == token_data.user_id).first()
+    result = await db.execute(select(models.User).where(models.User.id == token_data.user_id))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
     return user
@@ -1,8 +1,7 @@
 # app/database.py
 import os
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session # 导入 Session
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -11,20 +10,18 @@ load_dotenv()
 # 从环境变量获取数据库URL
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# 创建 SQLAlchemy 引擎
-engine = create_engine(DATABASE_URL)
+# 创建 SQLAlchemy 异步引擎 (使用 asyncpg 驱动)，数据库查询不再阻塞事件循环
+engine = create_async_engine(DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1))
 
 # 创建一个 SessionLocal 类
 # 每次数据库操作时，我们都会创建一个 SessionLocal 实例
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False：提交后对象属性仍然可用，避免在异步会话中触发隐式的懒加载
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 # 创建一个 Base 类，ORM 模型将继承自它
 Base = declarative_base()
 
 # 依赖项，用于获取数据库会话
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,62 @@
+# app/json_utils.py
+from typing import Optional
+
+_QUOTE = ord('"')
+_BACKSLASH = ord("\\")
+_COLON = ord(":")
+_OPENERS = b"{["
+_CLOSERS = b"}]"
+_JSON_WHITESPACE = b" \t\r\n"
+
+def _string_end(raw: bytes, start: int) -> int:
+    """返回从 start (开头的引号) 开始的 JSON 字符串结束引号的位置，找不到时返回 -1"""
+    pos = start + 1
+    while True:
+        end = raw.find(b'"', pos)
+        if end < 0:
+            return -1
+        # 结束引号前连续的反斜杠为偶数个时，引号没有被转义
+        backslashes = 0
+        while raw[end - 1 - backslashes] == _BACKSLASH:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end
+        pos = end + 1
+
+def _skip_whitespace(raw: bytes, pos: int) -> int:
+    while pos < len(raw) and raw[pos] in _JSON_WHITESPACE:
+        pos += 1
+    return pos
+
+def find_json_string_field(raw: bytes, key: bytes) -> Optional[memoryview]:
+    """在原始 JSON 字节中定位顶层对象里 key (如 b'"data"') 对应的字符串值，返回不复制数据的 memoryview。
+    只匹配顶层的键，嵌套对象中的同名键会被跳过；字符串 (包括很长的 base64) 通过 find 整段跳过。
+    字段不存在、值不是字符串或包含转义字符时返回 None，由调用方回退为完整解析。"""
+    depth = 0
+    pos = _skip_whitespace(raw, 0)
+    while pos < len(raw):
+        c = raw[pos]
+        if c == _QUOTE:
+            end = _string_end(raw, pos)
+            if end < 0:
+                return None
+            value_pos = _skip_whitespace(raw, end + 1)
+            is_key = value_pos < len(raw) and raw[value_pos] == _COLON
+            if depth == 1 and is_key and raw[pos:end + 1] == key:
+                value_pos = _skip_whitespace(raw, value_pos + 1)
+                if value_pos >= len(raw) or raw[value_pos] != _QUOTE:
+                    return None
+                value_end = _string_end(raw, value_pos)
+                if value_end < 0 or raw.find(b"\\", value_pos + 1, value_end) >= 0:
+                    return None
+                return memoryview(raw)[value_pos + 1:value_end]
+            pos = end + 1
+        elif c in _OPENERS:
+            depth += 1
+            pos += 1
+        elif c in _CLOSERS:
+            depth -= 1
+            pos += 1
+        else:
+            pos += 1
+    return None
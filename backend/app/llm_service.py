@@ -2,15 +2,24 @@
 import os
 from openai import AsyncOpenAI # 修改为 AsyncOpenAI
 from dotenv import load_dotenv
-from typing import List, Dict, Optional, Union # 导入 Union
+from typing import List, Dict, Optional, Union, AsyncIterator, BinaryIO # 导入 Union
 import httpx # 导入 httpx
 import base64 # 导入 base64
 import io # 导入 io 模块
-from qiniu import Auth, put_data, etag # 导入七牛云 SDK 相关的模块
+from qiniu import Auth # 七牛云 SDK，仅用于生成上传凭证
 import uuid # 导入 uuid 模块
+import asyncio # 导入 asyncio，用于请求合并
+import hashlib
+from collections import OrderedDict
+import orjson
+from .json_utils import find_json_string_field
+import time
+import logging
 
 load_dotenv(override=True) # 强制覆盖已存在的环境变量
 
+logger = logging.getLogger(__name__)
+
 # 从 .env 文件获取 Qwen API Key 和 Base URL
 QINIU_OPENAI_API_KEY = os.getenv("QINIU_OPENAI_API_KEY")
 QINIU_OPENAI_BASE_URL = os.getenv("QINIU_OPENAI_BASE_URL") # 直接从 .env 获取，确保一致
@@ -21,6 +30,7 @@ QINIU_ACCESS_KEY = os.getenv("QINIU_ACCESS_KEY")
 QINIU_SECRET_KEY = os.getenv("QINIU_SECRET_KEY")
 QINIU_BUCKET_NAME = os.getenv("QINIU_BUCKET_NAME")
 QINIU_DOMAIN = os.getenv("QINIU_DOMAIN") # 七牛云存储的自定义域名或测试域名
+QINIU_UPLOAD_URL = os.getenv("QINIU_UPLOAD_URL", "https://upload.qiniup.com") # 存储空间所在区域的上传域名
 
 if not QINIU_OPENAI_API_KEY:
     raise ValueError("QINIU_OPENAI_API_KEY environment variable not set.")
@@ -29,26 +39,74 @@ if not QINIU_OPENAI_BASE_URL:
 if not QINIU_ACCESS_KEY or not QINIU_SECRET_KEY or not QINIU_BUCKET_NAME or not QINIU_DOMAIN:
     raise ValueError("Qiniu Kodo environment variables (ACCESS_KEY, SECRET_KEY, BUCKET_NAME, DOMAIN) must be set.")
 
-print(f"QINIU_OPENAI_BASE_URL: {QINIU_OPENAI_BASE_URL}") # 添加调试打印
+logger.debug("QINIU_OPENAI_BASE_URL: %s", QINIU_OPENAI_BASE_URL)
 # 初始化 AsyncOpenAI 客户端，指向七牛云的兼容接口
 client = AsyncOpenAI(
     api_key=QINIU_OPENAI_API_KEY,
     base_url=QINIU_OPENAI_BASE_URL,
 )
 
-async def get_qwen_response(
-    system_prompt: str,
-    chat_history: List[Dict[str, str]], # 聊天历史，包含 sender_type 和 content
-    user_message: str,
-    few_shot_examples: Optional[List[Dict[str, str]]] = None,
-    temperature: float = 0.7,
-    max_tokens: int = 500,
-    model: str = "deepseek-v3" # 使用七牛云 Node.js 示例中的模型ID
-) -> str:
-    messages = []
+# 进程级共享的 httpx 客户端，复用到七牛云语音接口的 TCP/TLS 连接 (keep-alive + HTTP/2)
+# 首次使用时创建，关闭后再次使用会重新创建，与批处理 worker 一样跟随应用的生命周期
+_http: Optional[httpx.AsyncClient] = None
+# 上传到 Kodo 使用单独的连接池，避免把语音接口的 Bearer Token 和 JSON 头发送给存储服务
+_kodo_http: Optional[httpx.AsyncClient] = None
+
+def _get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            base_url=QINIU_OPENAI_BASE_URL,
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=30.0,
+            headers={
+                "Authorization": f"Bearer {QINIU_OPENAI_API_KEY}",
+                "Content-Type": "application/json",
+            },
+        )
+    return _http
+
+def _get_kodo_http() -> httpx.AsyncClient:
+    global _kodo_http
+    if _kodo_http is None or _kodo_http.is_closed:
+        _kodo_http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=30.0,
+        )
+    return _kodo_http
+
+async def close_http_client() -> None:
+    """关闭共享的 httpx 客户端，在应用关闭时调用"""
+    global _http, _kodo_http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+    if _kodo_http is not None:
+        await _kodo_http.aclose()
+        _kodo_http = None
+
+# --- LLM 回复缓存 ---
+# 以 (model, temperature, max_tokens, messages) 的哈希为键缓存回复，容量满时淘汰最久未使用的条目
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_MAX_HISTORY = 2 # 历史消息超过该条数时不查缓存，长对话几乎不可能命中
+
+_response_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+def _response_cache_key(model: str, temperature: float, max_tokens: int, messages: List[Dict[str, str]]) -> bytes:
+    return hashlib.blake2b(orjson.dumps([model, temperature, max_tokens, messages]), digest_size=16).digest()
+
+# 数据库中的 sender_type ('user' 或 'ai') 到 LLM 期望的 role ('user' 或 'assistant') 的映射
+_SENDER_ROLES = {"user": "user"}
+
+# 每个角色的 messages 前缀 (系统提示 + Few-Shot 示例)，在角色被修改前保持不变
+# role_id -> (updated_at, prefix_messages)
+_role_prefix_cache: Dict[uuid.UUID, tuple] = {}
 
+def build_prefix_messages(system_prompt: str, few_shot_examples: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+    """组装系统提示和 Few-Shot 示例部分的 messages"""
     # 添加系统提示
-    messages.append({"role": "system", "content": system_prompt})
+    messages = [{"role": "system", "content": system_prompt}]
 
     # 添加 Few-Shot 示例
     if few_shot_examples:
@@ -57,16 +115,71 @@ async def get_qwen_response(
                 messages.append({"role": "user", "content": example["user"]})
             if "ai" in example: # 注意 Few-shot 示例中的 AI 回复在 OpenAI API 中通常用 'assistant' 角色
                 messages.append({"role": "assistant", "content": example["ai"]})
+    return messages
+
+def get_prefix_messages(
+    system_prompt: str,
+    few_shot_examples: Optional[List[Dict[str, str]]] = None,
+    role_key: Optional[tuple] = None, # (role_id, role.updated_at)，提供时按角色缓存前缀
+) -> List[Dict[str, str]]:
+    if role_key is None:
+        return build_prefix_messages(system_prompt, few_shot_examples)
+
+    role_id, updated_at = role_key
+    cached = _role_prefix_cache.get(role_id)
+    if cached is not None and cached[0] == updated_at:
+        return cached[1]
+    prefix = build_prefix_messages(system_prompt, few_shot_examples)
+    _role_prefix_cache[role_id] = (updated_at, prefix) # 角色更新后覆盖旧条目
+    return prefix
+
+def build_messages(
+    system_prompt: str,
+    chat_history: List[Dict[str, str]], # 聊天历史，包含 sender_type 和 content
+    user_message: str,
+    few_shot_examples: Optional[List[Dict[str, str]]] = None,
+    role_key: Optional[tuple] = None,
+    summary: Optional[str] = None, # 较早对话的摘要，放在角色前缀之后，使前缀可以按角色复用
+) -> List[Dict[str, str]]:
+    """组装 OpenAI 兼容接口所需的 messages 列表"""
+    messages = [*get_prefix_messages(system_prompt, few_shot_examples, role_key)]
+
+    if summary:
+        messages.append({"role": "system", "content": f"此前对话的摘要：{summary}"})
 
     # 添加历史消息
-    for msg in chat_history:
-        # 将我们数据库中的 sender_type ('user' 或 'ai') 转换为 LLM 期望的 role ('user' 或 'assistant')
-        role_type = "user" if msg["sender_type"] == "user" else "assistant"
-        messages.append({"role": role_type, "content": msg["content"]})
+    messages.extend(
+        {"role": _SENDER_ROLES.get(msg["sender_type"], "assistant"), "content": msg["content"]}
+        for msg in chat_history
+    )
 
     # 添加当前用户消息
     messages.append({"role": "user", "content": user_message})
 
+    return messages
+
+async def get_qwen_response(
+    system_prompt: str,
+    chat_history: List[Dict[str, str]], # 聊天历史，包含 sender_type 和 content
+    user_message: str,
+    few_shot_examples: Optional[List[Dict[str, str]]] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+    model: str = "deepseek-v3", # 使用七牛云 Node.js 示例中的模型ID
+    role_key: Optional[tuple] = None, # (role_id, role.updated_at)，用于缓存角色前缀
+    summary: Optional[str] = None, # 较早对话的摘要
+    cacheable: bool = False # 调用方允许复用相同输入的回复 (temperature 为 0 时总是可缓存)
+) -> str:
+    messages = build_messages(system_prompt, chat_history, user_message, few_shot_examples, role_key, summary)
+
+    cache_key = None
+    if (cacheable or temperature == 0) and len(chat_history) <= RESPONSE_CACHE_MAX_HISTORY:
+        cache_key = _response_cache_key(model, temperature, max_tokens, messages)
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            _response_cache.move_to_end(cache_key)
+            return cached
+
     try:
         completion = await client.chat.completions.create(
             model=model,
@@ -74,78 +187,237 @@ async def get_qwen_response(
             temperature=temperature,
             max_tokens=max_tokens,
         )
-        return completion.choices[0].message.content
+        content = completion.choices[0].message.content
+        if cache_key is not None and content:
+            _response_cache[cache_key] = content
+            if len(_response_cache) > RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
+        return content
     except Exception as e:
-        print(f"Error calling Qwen API: {e}")
+        logger.error("Error calling Qwen API: %s", e)
         return "Sorry, I am unable to respond at the moment."
 
-async def get_asr_transcript(audio_file_like: Union[str, io.BytesIO], model: str = QINIU_OPENAI_ASR_MODEL_ID) -> str:
-    """将音频文件转录为文本"""
+async def stream_qwen_response(
+    system_prompt: str,
+    chat_history: List[Dict[str, str]],
+    user_message: str,
+    few_shot_examples: Optional[List[Dict[str, str]]] = None,
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+    model: str = "deepseek-v3",
+    role_key: Optional[tuple] = None,
+    summary: Optional[str] = None
+) -> AsyncIterator[str]:
+    """与 get_qwen_response 相同，但以流式方式逐段产出回复内容"""
+    messages = build_messages(system_prompt, chat_history, user_message, few_shot_examples, role_key, summary)
+
+    received_any = False
+    try:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                received_any = True
+                yield content
+    except Exception as e:
+        logger.error("Error streaming from Qwen API: %s", e)
+        if not received_any:
+            yield "Sorry, I am unable to respond at the moment."
+
+SUMMARY_SYSTEM_PROMPT = "你是一个对话摘要助手。请将以下对话（以及已有的摘要）压缩为一段简洁的摘要，保留人物、事件、用户偏好等关键信息，使角色能够据此继续对话。只输出摘要本身。"
+
+async def get_chat_summary(
+    previous_summary: Optional[str],
+    messages: List[Dict[str, str]], # 需要被压缩的消息，包含 sender_type 和 content
+    max_tokens: int = 300,
+    model: str = "deepseek-v3"
+) -> Optional[str]:
+    """将已有摘要与一段较早的聊天记录合并为新的滚动摘要，失败时返回 None"""
+    transcript_lines = []
+    if previous_summary:
+        transcript_lines.append(f"已有摘要：{previous_summary}")
+    for msg in messages:
+        speaker = "用户" if msg["sender_type"] == "user" else "AI"
+        transcript_lines.append(f"{speaker}：{msg['content']}")
+
     try:
-        audio_content: bytes
-        filename: str
-
-        if isinstance(audio_file_like, io.BytesIO):
-            audio_content = audio_file_like.getvalue()
-            filename = f"audio-{uuid.uuid4()}.webm" # 生成唯一文件名
-        elif isinstance(audio_file_like, str):
-            with open(audio_file_like, "rb") as f:
-                audio_content = f.read()
-            filename = os.path.basename(audio_file_like) # 使用原始文件名
+        completion = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": "\n".join(transcript_lines)},
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens,
+        )
+        return completion.choices[0].message.content
+    except Exception as e:
+        logger.error("Error summarizing chat history: %s", e)
+        return None
+
+# --- LLM 请求合并 (micro-batching) ---
+# 后台任务每次取出队列中已经到达的所有请求，并通过 asyncio.gather 并发发往上游
+# 上游没有批量补全接口，批次内的请求仍是各自独立的调用，所以这里不等待额外的请求：
+# 固定的等待窗口只会给每个请求增加延迟
+
+_request_queue: Optional[asyncio.Queue] = None
+_batch_worker: Optional[asyncio.Task] = None
+_running_batches: set = set() # 持有批次任务的引用，避免被垃圾回收
+
+def start_batch_worker() -> None:
+    """在当前事件循环上创建请求队列和后台合并任务，在应用启动时调用"""
+    global _request_queue, _batch_worker
+    _request_queue = asyncio.Queue()
+    _batch_worker = asyncio.get_running_loop().create_task(_drain_requests())
+
+async def stop_batch_worker() -> None:
+    """取消后台合并任务以及尚未执行的请求，在应用关闭时调用"""
+    global _request_queue, _batch_worker
+    if _batch_worker is not None:
+        _batch_worker.cancel()
+        try:
+            await _batch_worker
+        except asyncio.CancelledError:
+            pass
+    if _request_queue is not None:
+        while not _request_queue.empty():
+            _, future = _request_queue.get_nowait()
+            future.cancel()
+    _request_queue = None
+    _batch_worker = None
+
+def submit(
+    system_prompt: str,
+    chat_history: List[Dict[str, str]],
+    user_message: str,
+    **kwargs,
+) -> asyncio.Future:
+    """提交一个 LLM 请求到合并队列，返回可 await 的 Future，结果与 get_qwen_response 相同"""
+    loop = asyncio.get_running_loop()
+    # 队列和后台任务绑定在创建它们的事件循环上；未启动或属于已关闭的其他事件循环时重新创建
+    if _batch_worker is None or _batch_worker.done() or _batch_worker.get_loop() is not loop:
+        start_batch_worker()
+
+    future = loop.create_future()
+    request_kwargs = dict(system_prompt=system_prompt, chat_history=chat_history, user_message=user_message, **kwargs)
+    _request_queue.put_nowait((request_kwargs, future))
+    return future
+
+async def _drain_requests() -> None:
+    """后台任务：取出队列中已有的所有请求，作为一批并发执行"""
+    while True:
+        batch = [await _request_queue.get()]
+        while not _request_queue.empty():
+            batch.append(_request_queue.get_nowait())
+        # 不阻塞下一批的收集，批次在独立任务中执行
+        task = asyncio.create_task(_run_batch(batch))
+        _running_batches.add(task)
+        task.add_done_callback(_running_batches.discard)
+
+async def _run_batch(batch: List[tuple]) -> None:
+    results = await asyncio.gather(
+        *[get_qwen_response(**request_kwargs) for request_kwargs, _ in batch],
+        return_exceptions=True,
+    )
+    for (_, future), result in zip(batch, results):
+        if future.done(): # 调用方已取消 (例如客户端断开连接)
+            continue
+        if isinstance(result, BaseException):
+            future.set_exception(result)
         else:
-            raise ValueError("audio_file_like must be a BytesIO object or a file path string.")
+            future.set_result(result)
 
-        # 上传音频到七牛云 Kodo
-        public_url = await upload_audio_to_qiniu_kodo(audio_content, filename)
-        if not public_url:
-            print("Failed to upload audio to Qiniu Kodo.")
-            return ""
+# 不超过该大小的音频以 base64 内联发送给 ASR，更大的音频回退为先上传 Kodo
+ASR_INLINE_AUDIO_MAX_BYTES = 1024 * 1024
 
-        # 调用七牛云 ASR API
-        url = f"{QINIU_OPENAI_BASE_URL}/voice/asr"
-        headers = {
-            "Authorization": f"Bearer {QINIU_OPENAI_API_KEY}",
-            "Content-Type": "application/json",
+async def _post_asr(audio_payload: Dict[str, str], debug_audio: Optional[str] = None) -> httpx.Response:
+    """发送一次 ASR 请求；debug_audio 用于在日志中代替内联的 base64 音频"""
+    payload = {
+        "audio": audio_payload,
+        "request": {
+            "language": "zh", # 或根据需要设置为 "en"
+            "profanity_filter": False
         }
-        payload = {
-            "audio": {
+    }
+
+    # 仅在开启 DEBUG 时才格式化请求内容
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("ASR request payload: %s", debug_audio or payload)
+
+    return await _get_http().post("/voice/asr", content=orjson.dumps(payload)) # 使用 orjson 序列化，Content-Type 由共享客户端设置
+
+async def get_asr_transcript(audio_file: Union[str, BinaryIO], model: str = QINIU_OPENAI_ASR_MODEL_ID) -> str:
+    """将音频文件转录为文本，audio_file 可以是文件路径或二进制文件对象 (如 UploadFile.file)"""
+    opened_file = None
+    try:
+        # 上传凭证不允许覆盖同名文件，因此总是生成唯一文件名；文件路径只保留其扩展名
+        extension = ".webm"
+        if isinstance(audio_file, str):
+            extension = os.path.splitext(audio_file)[1] or extension
+            opened_file = audio_file = open(audio_file, "rb")
+        filename = f"audio-{uuid.uuid4()}{extension}"
+
+        # 通过 seek 获取音频大小，不把整个文件读入内存
+        audio_file.seek(0, io.SEEK_END)
+        audio_size = audio_file.tell()
+        audio_file.seek(0)
+
+        # 调用七牛云 ASR API
+        response = None
+        if audio_size <= ASR_INLINE_AUDIO_MAX_BYTES:
+            # 短音频先尝试以 base64 内联发送，省去上传 Kodo 以及 ASR 服务回源下载的往返
+            response = await _post_asr(
+                {
+                    "data": base64.b64encode(audio_file.read()).decode("ascii"),
+                    "encoding": "webm", # 根据前端录音格式调整
+                },
+                debug_audio=f"<{audio_size} bytes inline audio>"
+            )
+            if response.is_client_error:
+                # 接口不接受内联音频时，回退为上传 Kodo 后传递 URL
+                logger.warning("Inline ASR request rejected (%s), retrying via Qiniu Kodo: %s", response.status_code, response.text)
+                audio_file.seek(0)
+                response = None
+
+        if response is None:
+            # 较大的音频 (或内联失败时) 先流式上传到七牛云 Kodo，再传递公共访问 URL
+            public_url = await upload_audio_to_qiniu_kodo(audio_file, filename)
+            if not public_url:
+                logger.error("Failed to upload audio to Qiniu Kodo.")
+                return ""
+            response = await _post_asr({
                 "url": public_url, # 传递公共访问 URL
                 "encoding": "webm", # 根据前端录音格式调整
-            },
-            "request": {
-                "language": "zh", # 或根据需要设置为 "en"
-                "profanity_filter": False
-            }
-        }
+            })
 
-        print(f"ASR Request URL: {url}")
-        print(f"ASR Request Headers: {headers}")
-        print(f"ASR Request Payload: {payload}")
-
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.post(url, headers=headers, json=payload)
-            response.raise_for_status() # 检查 HTTP 错误
-            
-            response_data = response.json()
-            transcript = response_data.get("data", {}).get("text")
-            if not transcript:
-                print(f"No transcript found in ASR response. Response: {response_data}")
-                return ""
-            return transcript
+        response.raise_for_status() # 检查 HTTP 错误
+
+        response_data = orjson.loads(response.content)
+        transcript = response_data.get("data", {}).get("text")
+        if not transcript:
+            logger.warning("No transcript found in ASR response. Response: %s", response_data)
+            return ""
+        return transcript
     except httpx.HTTPStatusError as e:
-        print(f"Error calling Qiniu ASR API: {e} - {e.response.text}")
+        logger.error("Error calling Qiniu ASR API: %s - %s", e, e.response.text)
         return ""
     except Exception as e:
-        print(f"Error in get_asr_transcript: {e}")
+        logger.error("Error in get_asr_transcript: %s", e)
         return ""
+    finally:
+        if opened_file is not None:
+            opened_file.close()
 
 async def get_tts_audio(text: str, model: str = QINIU_OPENAI_TTS_MODEL_ID, voice_type: str = "qiniu_zh_female_tmjxxy") -> bytes:
     """将文本转为音频并返回音频字节流 (使用七牛云 TTS API)"""
-    url = f"{QINIU_OPENAI_BASE_URL}/voice/tts"
-    headers = {
-        "Authorization": f"Bearer {QINIU_OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "audio": {
             "voice_type": voice_type, # 使用七牛云的音色类型
@@ -157,46 +429,64 @@ async def get_tts_audio(text: str, model: str = QINIU_OPENAI_TTS_MODEL_ID, voice
         }
     }
 
-    print(f"TTS Request URL: {url}") # 调试打印
-    print(f"TTS Request Headers: {headers}") # 调试打印
-    print(f"TTS Request Payload: {payload}") # 调试打印
+    logger.debug("TTS request payload: %s", payload)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status() # 检查 HTTP 错误
-            
-            response_data = response.json()
-            base64_audio = response_data.get("data")
-            if not base64_audio:
-                raise ValueError("No audio data found in TTS response.")
-            
-            return base64.b64decode(base64_audio) # 解码 base64 音频数据
+        response = await _get_http().post("/voice/tts", content=orjson.dumps(payload))
+        response.raise_for_status() # 检查 HTTP 错误
+
+        raw = response.content
+        # 直接在原始字节中定位 base64 音频，避免把整个 JSON 解码成 str 再编码回字节
+        base64_audio = find_json_string_field(raw, b'"data"')
+        if base64_audio is None:
+            # 无法安全定位时回退为完整解析 JSON
+            base64_audio = orjson.loads(raw).get("data")
+        if not base64_audio:
+            raise ValueError("No audio data found in TTS response.")
+
+        return base64.b64decode(base64_audio) # 解码 base64 音频数据
     except httpx.HTTPStatusError as e:
-        print(f"Error calling Qiniu TTS API: {e} - {e.response.text}")
+        logger.error("Error calling Qiniu TTS API: %s - %s", e, e.response.text)
         return b""
     except Exception as e:
-        print(f"Error calling Qiniu TTS API: {e}")
+        logger.error("Error calling Qiniu TTS API: %s", e)
         return b""
  
-async def upload_audio_to_qiniu_kodo(audio_content: bytes, filename: str) -> Optional[str]:
-    """将音频内容上传到七牛云 Kodo，并返回公共访问 URL。"""
+# Kodo 上传凭证缓存：凭证只限定存储空间 (不绑定文件名)，因此可以在多次上传之间复用
+# 这种凭证只允许新增文件，同名文件已存在时上传会失败，调用方需要使用唯一的文件名
+UPLOAD_TOKEN_EXPIRES = 3600 # 有效期 1 小时
+
+_qiniu_auth = Auth(QINIU_ACCESS_KEY, QINIU_SECRET_KEY)
+_upload_token_cache: Optional[tuple] = None # (token, 过期时间戳)
+
+def get_kodo_upload_token() -> str:
+    """返回缓存的上传凭证，剩余有效期不足一半时重新签发"""
+    global _upload_token_cache
+    now = time.time()
+    if _upload_token_cache is None or now > _upload_token_cache[1] - UPLOAD_TOKEN_EXPIRES / 2:
+        token = _qiniu_auth.upload_token(QINIU_BUCKET_NAME, None, UPLOAD_TOKEN_EXPIRES)
+        _upload_token_cache = (token, now + UPLOAD_TOKEN_EXPIRES)
+    return _upload_token_cache[0]
+
+async def upload_audio_to_qiniu_kodo(audio_content: Union[bytes, BinaryIO], filename: str) -> Optional[str]:
+    """将音频内容 (字节或文件对象) 上传到七牛云 Kodo，并返回公共访问 URL。文件对象会被分块读取发送。"""
     try:
-        q = Auth(QINIU_ACCESS_KEY, QINIU_SECRET_KEY)
-        token = q.upload_token(QINIU_BUCKET_NAME, filename, 3600) # 有效期 1 小时
-        
-        # 使用 put_data 上传文件
-        # put_data 返回三个值：ret, info, url_path
-        # ret 包含上传成功后的文件信息，info 包含响应信息
-        ret, info = put_data(token, filename, audio_content)
-        
-        if ret and info.status_code == 200:
+        token = get_kodo_upload_token()
+
+        # 直接调用 Kodo 的表单上传接口，上传过程不阻塞事件循环 (SDK 的 put_data 是同步的)
+        response = await _get_kodo_http().post(
+            QINIU_UPLOAD_URL,
+            data={"token": token, "key": filename},
+            files={"file": (filename, audio_content)},
+        )
+
+        if response.status_code == 200:
             # 上传成功，构建公共访问 URL
             public_url = f"https://{QINIU_DOMAIN}/{filename}"
-            print(f"Successfully uploaded {filename} to Qiniu Kodo. URL: {public_url}")
+            logger.debug("Successfully uploaded %s to Qiniu Kodo. URL: %s", filename, public_url)
             return public_url
         else:
-            print(f"Failed to upload {filename} to Qiniu Kodo. Info: {info}")
+            logger.error("Failed to upload %s to Qiniu Kodo. Status: %s, Response: %s", filename, response.status_code, response.text)
             return None
     except Exception as e:
-        print(f"Error uploading audio to Qiniu Kodo: {e}")
+        logger.error("Error uploading audio to Qiniu Kodo: %s", e)
         return None
\ No newline at end of file
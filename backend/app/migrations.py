@@ -0,0 +1,32 @@
+# app/migrations.py
+# Base.metadata.create_all 只会创建缺失的表，不会修改已有的表。
+# 这里补齐已有数据库缺少的列和索引，所有步骤都可以重复执行，在应用启动时运行。
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+async def column_exists(conn: AsyncConnection, table: str, column: str) -> bool:
+    result = await conn.execute(
+        text("SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column"),
+        {"table": table, "column": column}
+    )
+    return result.first() is not None
+
+async def run_migrations(conn: AsyncConnection):
+    # Chat 的滚动摘要：仅在列不存在时执行 ALTER，避免每次启动都获取表的排他锁
+    if not await column_exists(conn, "chats", "summary"):
+        await conn.execute(text("ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary TEXT"))
+    if not await column_exists(conn, "chats", "summary_upto_order"):
+        await conn.execute(text("ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary_upto_order INTEGER NOT NULL DEFAULT 0"))
+
+    # Chat 的冗余消息计数：列不存在时添加，并按已有消息回填，保证新消息的 order_in_chat 接在最后一条之后
+    if not await column_exists(conn, "chats", "message_count"):
+        await conn.execute(text("ALTER TABLE chats ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0"))
+        await conn.execute(text(
+            "UPDATE chats SET message_count = ("
+            "SELECT COALESCE(MAX(order_in_chat) + 1, 0) FROM messages WHERE messages.chat_id = chats.id"
+            ")"
+        ))
+
+    # 消息和聊天列表查询使用的复合索引
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_messages_chat_order ON messages (chat_id, order_in_chat)"))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chats_user_created ON chats (user_id, created_at)"))
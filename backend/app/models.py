@@ -1,8 +1,9 @@
 # app/models.py
 import uuid
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index, func, select
 from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.orm import relationship, Session # 导入 Session
+from sqlalchemy.orm import relationship
+from sqlalchemy.ext.asyncio import AsyncSession
 from .database import Base
 
 class User(Base):
@@ -38,6 +39,9 @@ class Chat(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     role_id = Column(UUID(as_uuid=True), ForeignKey("roles.id"), nullable=False)
     title = Column(String(255), nullable=True)
+    summary = Column(Text, nullable=True) # 较早消息的滚动摘要
+    summary_upto_order = Column(Integer, default=0, server_default="0", nullable=False) # 摘要已覆盖到的 order_in_chat (不含)
+    message_count = Column(Integer, default=0, server_default="0", nullable=False) # 冗余的消息计数，用于分配 order_in_chat
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
@@ -45,6 +49,11 @@ class Chat(Base):
     role = relationship("Role", back_populates="chats")
     messages = relationship("Message", back_populates="chat", order_by="Message.order_in_chat", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # 支持按用户列出聊天并按创建时间排序，无需额外排序
+        Index("ix_chats_user_created", "user_id", "created_at"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -57,6 +66,11 @@ class Message(Base):
 
     chat = relationship("Chat", back_populates="messages")
 
+    __table_args__ = (
+        # 按聊天读取有序消息时走索引范围扫描，无需额外排序
+        Index("ix_messages_chat_order", "chat_id", "order_in_chat"),
+    )
+
 # ... (app/models.py 文件前面已有的模型定义) ...
 
 # 默认角色数据
@@ -87,11 +101,12 @@ DEFAULT_ROLES = [
     }
 ]
 
-def create_default_roles(db: Session):
+async def create_default_roles(db: AsyncSession):
     for role_data in DEFAULT_ROLES:
         # 检查角色是否已存在，避免重复创建
-        existing_role = db.query(Role).filter(Role.name == role_data["name"]).first()
+        result = await db.execute(select(Role).where(Role.name == role_data["name"]))
+        existing_role = result.scalars().first()
         if not existing_role:
             db_role = Role(**role_data)
             db.add(db_role)
-    db.commit()
\ No newline at end of file
+    await db.commit()
\ No newline at end of file
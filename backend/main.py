@@ -1,17 +1,26 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from app.database import SessionLocal, engine, Base, get_db # get_db 现在从这里导入
-from app import models, schemas, auth
+from app import models, schemas, auth, migrations
 from datetime import timedelta
 from typing import List
 import uuid
+import json
+import logging
 from app import models, schemas, auth, llm_service # 导入 llm_service
 from fastapi import UploadFile, File, Response
 from fastapi.responses import StreamingResponse
-import io
 from fastapi.middleware.cors import CORSMiddleware # 导入 CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# 摘要之后保留的最近消息条数：未摘要的消息超过 2 倍该值时，把除最近这些之外的消息压缩进 Chat.summary
+CHAT_HISTORY_WINDOW = 20
 
 # 定义 OpenAPI tags metadata，用于组织 Swagger UI
 tags_metadata = [
@@ -70,50 +79,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 创建所有数据库表
-Base.metadata.create_all(bind=engine)
-
-# 在应用启动时创建默认角色
-db = SessionLocal()
-try:
-    models.create_default_roles(db)
-finally:
-    db.close()
+@app.on_event("startup")
+async def startup_event():
+    # 创建所有数据库表 (在应用启动时执行，而不是在导入模块时)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # 为已有数据库补齐新增的列和索引
+        await migrations.run_migrations(conn)
+
+    # 创建默认角色；角色表已有数据时跳过，已初始化的数据库只需一次查询
+    async with SessionLocal() as db:
+        result = await db.execute(select(models.Role.id).limit(1))
+        if result.first() is None:
+            await models.create_default_roles(db)
+
+    # 在应用的事件循环上启动 LLM 请求合并任务
+    llm_service.start_batch_worker()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 停止 LLM 请求合并任务，并关闭 llm_service 中共享的 httpx 连接池
+    await llm_service.stop_batch_worker()
+    await llm_service.close_http_client()
 
 @app.get("/", tags=["General"], include_in_schema=False)
 async def read_root():
     return {"message": "Hello, FastAPI Backend!"}
 
 @app.get("/items/{item_id}", tags=["General"], include_in_schema=False)
-async def read_item(item_id: int, q: str = None, db: Session = Depends(get_db)):
+async def read_item(item_id: int, q: str = None, db: AsyncSession = Depends(get_db)):
     return {"item_id": item_id, "q": q}
 
 # --- 用户认证相关的 API 路由 ---
 
 @app.post("/register", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED, tags=["Authentication"])
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user_by_username = auth.get_user_by_username(db, username=user.username)
-    if db_user_by_username:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
-    db_user_by_email = auth.get_user_by_email(db, email=user.email)
-    if db_user_by_email:
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    # bcrypt 哈希耗时较长，放到线程池中执行，不阻塞事件循环
+    hashed_password = await run_in_threadpool(auth.get_password_hash, user.password)
+
+    db_user = await auth.create_user(db, user.username, user.email, hashed_password)
+    if not db_user:
+        # 插入因唯一约束冲突被跳过，再查询确定是哪个字段冲突
+        if await auth.get_user_by_username(db, user.username):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-
-    hashed_password = auth.get_password_hash(user.password)
-    db_user = models.User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
     return db_user
 
 @app.post("/token", response_model=schemas.Token, tags=["Authentication"])
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = auth.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await auth.get_user_by_username(db, username=form_data.username)
+    # bcrypt 校验同样放到线程池中执行
+    if not user or not await run_in_threadpool(auth.verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -133,7 +149,7 @@ async def read_users_me(current_user: models.User = Depends(auth.get_current_act
 # --- 角色相关的 API 路由 ---
 
 @app.post("/roles/", response_model=schemas.RoleResponse, status_code=status.HTTP_201_CREATED, tags=["Roles"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
-def create_role(role: schemas.RoleCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def create_role(role: schemas.RoleCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     db_role = models.Role(
         name=role.name,
         description=role.description,
@@ -142,18 +158,20 @@ def create_role(role: schemas.RoleCreate, db: Session = Depends(get_db), current
         is_active=role.is_active
     )
     db.add(db_role)
-    db.commit()
-    db.refresh(db_role)
+    await db.commit()
+    await db.refresh(db_role)
     return db_role
 
 @app.get("/roles/", response_model=List[schemas.RoleResponse], tags=["Roles"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
-def get_roles(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
-    roles = db.query(models.Role).filter(models.Role.is_active == True).all()
+async def get_roles(db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    result = await db.execute(select(models.Role).where(models.Role.is_active == True))
+    roles = result.scalars().all()
     return roles
 
 @app.get("/roles/{role_id}", response_model=schemas.RoleResponse, tags=["Roles"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
-def get_role(role_id: uuid.UUID, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
-    role = db.query(models.Role).filter(models.Role.id == role_id, models.Role.is_active == True).first()
+async def get_role(role_id: uuid.UUID, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    result = await db.execute(select(models.Role).where(models.Role.id == role_id, models.Role.is_active == True))
+    role = result.scalars().first()
     if not role:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Role not found or inactive")
     return role
@@ -161,19 +179,21 @@ def get_role(role_id: uuid.UUID, db: Session = Depends(get_db), current_user: mo
 # --- 聊天相关的 API 路由 ---
 
 @app.post("/chats/", response_model=schemas.ChatResponse, status_code=status.HTTP_201_CREATED, tags=["Chats"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
-def create_chat(chat_create: schemas.ChatCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
-    role = db.query(models.Role).filter(models.Role.id == chat_create.role_id, models.Role.is_active == True).first()
+async def create_chat(chat_create: schemas.ChatCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    result = await db.execute(select(models.Role).where(models.Role.id == chat_create.role_id, models.Role.is_active == True))
+    role = result.scalars().first()
     if not role:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Role not found or inactive")
 
     db_chat = models.Chat(
         user_id=current_user.id,
         role_id=chat_create.role_id,
-        title=chat_create.title if chat_create.title else f"Chat with {role.name}"
+        title=chat_create.title if chat_create.title else f"Chat with {role.name}",
+        message_count=1 # 包含下面的初始 AI 问候
     )
     db.add(db_chat)
-    db.commit()
-    db.refresh(db_chat)
+    await db.commit()
+    await db.refresh(db_chat)
 
     initial_ai_message_content = f"Hello, I am {role.name}. How can I help you today?"
     initial_ai_message = models.Message(
@@ -183,131 +203,214 @@ def create_chat(chat_create: schemas.ChatCreate, db: Session = Depends(get_db),
         order_in_chat=0
     )
     db.add(initial_ai_message)
-    db.commit()
-    db.refresh(initial_ai_message)
+    await db.commit()
+    await db.refresh(initial_ai_message)
 
     return db_chat
 
 @app.get("/chats/", response_model=List[schemas.ChatResponse], tags=["Chats"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
-def get_user_chats(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
-    chats = db.query(models.Chat).filter(models.Chat.user_id == current_user.id).order_by(models.Chat.created_at.desc()).all()
+async def get_user_chats(db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    result = await db.execute(select(models.Chat).where(models.Chat.user_id == current_user.id).order_by(models.Chat.created_at.desc()))
+    chats = result.scalars().all()
     return chats
 
 @app.get("/chats/{chat_id}/messages", response_model=List[schemas.MessageResponse], tags=["Chats"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
-def get_chat_messages(chat_id: uuid.UUID, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
-    chat = db.query(models.Chat).filter(models.Chat.id == chat_id, models.Chat.user_id == current_user.id).first()
-    if not chat:
+async def get_chat_messages(chat_id: uuid.UUID, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    result = await db.execute(select(models.Chat.id).where(models.Chat.id == chat_id, models.Chat.user_id == current_user.id))
+    if result.first() is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found or unauthorized")
 
-    messages = db.query(models.Message).filter(models.Message.chat_id == chat_id).order_by(models.Message.order_in_chat).all()
+    result = await db.execute(select(models.Message).where(models.Message.chat_id == chat_id).order_by(models.Message.order_in_chat))
+    messages = result.scalars().all()
     return messages
 
-@app.post("/chats/{chat_id}/message", response_model=schemas.MessageResponse, tags=["Chats"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
-async def send_message(chat_id: uuid.UUID, message: schemas.MessageCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
-    chat = db.query(models.Chat).filter(models.Chat.id == chat_id, models.Chat.user_id == current_user.id).first()
+async def update_chat_summary(chat_id: uuid.UUID):
+    """后台任务：把滑动窗口之外、尚未摘要的消息合并进 Chat.summary"""
+    async with SessionLocal() as db:
+        try:
+            result = await db.execute(select(models.Chat).where(models.Chat.id == chat_id))
+            chat = result.scalars().first()
+            if not chat:
+                return
+            summary_upto_order = chat.summary_upto_order
+            new_upto_order = chat.message_count - CHAT_HISTORY_WINDOW
+            if new_upto_order <= summary_upto_order:
+                return
+
+            result = await db.execute(select(models.Message).where(
+                models.Message.chat_id == chat_id,
+                models.Message.order_in_chat >= summary_upto_order,
+                models.Message.order_in_chat < new_upto_order
+            ).order_by(models.Message.order_in_chat))
+            skipped_messages = result.scalars().all()
+            # 结束读事务并把连接归还连接池，等待 LLM 时不占用数据库连接；下面的更新在新事务中执行
+            await db.commit()
+
+            summary = await llm_service.get_chat_summary(
+                previous_summary=chat.summary,
+                messages=[{"sender_type": msg.sender_type, "content": msg.content} for msg in skipped_messages]
+            )
+            if not summary:
+                return
+
+            # 仅当摘要进度未被其他任务推进时才更新，保证两列原子地一起变化
+            await db.execute(
+                update(models.Chat)
+                .where(models.Chat.id == chat_id, models.Chat.summary_upto_order == summary_upto_order)
+                .values(summary=summary, summary_upto_order=new_upto_order)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error("Error updating chat summary: %s", e)
+
+async def build_llm_request(chat_id: uuid.UUID, db: AsyncSession, current_user: models.User):
+    """加载聊天、角色和最近的历史消息，返回 LLM 调用参数以及当前的摘要进度"""
+    # 通过 joinedload 在同一次查询中取回关联的角色
+    result = await db.execute(select(models.Chat).options(joinedload(models.Chat.role)).where(models.Chat.id == chat_id, models.Chat.user_id == current_user.id))
+    chat = result.scalars().first()
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found or unauthorized")
 
-    current_message_count = db.query(models.Message).filter(models.Message.chat_id == chat_id).count()
-
-    # 保存用户消息
-    db_user_message = models.Message(
-        chat_id=chat_id,
-        sender_type="user",
-        content=message.content,
-        order_in_chat=current_message_count
-    )
-    db.add(db_user_message)
-    db.commit()
-    db.refresh(db_user_message)
-
-    # --- 调用 LLM 服务获取真实回复 ---
-    role = db.query(models.Role).filter(models.Role.id == chat.role_id).first()
+    role = chat.role
     if not role:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Associated role not found")
 
-    # 获取聊天历史 (需要调整，以符合 LLM 接口的 messages 格式)
-    # 我们需要从数据库中获取所有历史消息，并按顺序组织成 LLM 需要的格式
-    chat_history_db = db.query(models.Message).filter(models.Message.chat_id == chat_id).order_by(models.Message.order_in_chat).all()
-    
+    # 取摘要尚未覆盖的全部消息，与 Chat.summary 一起完整覆盖整个对话
+    # (后台摘要任务使这部分保持在约 2 * CHAT_HISTORY_WINDOW 条以内；本次用户消息尚未入库，会单独作为 user_message 传入)
+    result = await db.execute(select(models.Message).where(
+        models.Message.chat_id == chat_id,
+        models.Message.order_in_chat >= chat.summary_upto_order
+    ).order_by(models.Message.order_in_chat))
+    chat_history_db = result.scalars().all()
+
     # 转换为 LLM 期望的格式 (只包含 sender_type 和 content)
     llm_chat_history = []
     for msg in chat_history_db:
         llm_chat_history.append({"sender_type": msg.sender_type, "content": msg.content})
 
-    ai_response_content = await llm_service.get_qwen_response(
-        system_prompt=role.system_prompt,
-        chat_history=llm_chat_history, # 传递所有历史消息
-        user_message=message.content,
-        few_shot_examples=role.few_shot_examples,
-        model="deepseek-v3" # 确保使用正确的模型ID
+    llm_request = {
+        "system_prompt": role.system_prompt,
+        "chat_history": llm_chat_history, # 传递最近的历史消息
+        "few_shot_examples": role.few_shot_examples,
+        "role_key": (role.id, role.updated_at), # llm_service 按角色缓存系统提示 + Few-Shot 前缀
+        "summary": chat.summary, # 更早的对话以摘要的形式提供
+        "model": "deepseek-v3", # 确保使用正确的模型ID
+    }
+    summary_upto_order = chat.summary_upto_order
+
+    # 结束只读事务，在等待 LLM 期间把连接归还连接池，避免连接池成为并发上限
+    # (expire_on_commit=False，已加载的数据在提交后仍可使用)
+    await db.commit()
+    return llm_request, summary_upto_order
+
+async def save_chat_turn(db: AsyncSession, chat_id: uuid.UUID, user_content: str, ai_content: str, summary_upto_order: int, background_tasks: BackgroundTasks) -> models.Message:
+    """保存一轮对话 (用户消息 + AI 回复)，必要时安排摘要后台任务"""
+    # 原子地为用户消息和 AI 回复预留两个 order_in_chat，代替 count() 查询
+    result = await db.execute(
+        update(models.Chat)
+        .where(models.Chat.id == chat_id)
+        .values(message_count=models.Chat.message_count + 2)
+        .returning(models.Chat.message_count)
     )
-    # --- LLM 调用结束 ---
+    message_count = result.scalar_one()
 
-    # 保存 AI 回复
+    # 用户消息和 AI 回复在同一个事务中保存，每轮对话只提交一次
+    db_user_message = models.Message(
+        chat_id=chat_id,
+        sender_type="user",
+        content=user_content,
+        order_in_chat=message_count - 2
+    )
     db_ai_message = models.Message(
         chat_id=chat_id,
         sender_type="ai",
-        content=ai_response_content,
-        order_in_chat=current_message_count + 1
+        content=ai_content,
+        order_in_chat=message_count - 1
     )
-    db.add(db_ai_message)
-    db.commit()
-    db.refresh(db_ai_message)
+    db.add_all([db_user_message, db_ai_message])
+    await db.commit()
+    await db.refresh(db_ai_message)
+
+    # 未摘要的消息超过两个窗口时，在后台压缩更早的历史
+    if message_count - summary_upto_order > 2 * CHAT_HISTORY_WINDOW:
+        background_tasks.add_task(update_chat_summary, chat_id)
 
     return db_ai_message
 
+@app.post("/chats/{chat_id}/message", response_model=schemas.MessageResponse, tags=["Chats"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
+async def send_message(chat_id: uuid.UUID, message: schemas.MessageCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    llm_request, summary_upto_order = await build_llm_request(chat_id, db, current_user)
+
+    # --- 调用 LLM 服务获取真实回复 ---
+    # 开场的短对话 (如 "你好") 允许复用缓存的回复，长对话由 llm_service 自动跳过缓存
+    ai_response_content = await llm_service.submit(user_message=message.content, cacheable=True, **llm_request)
+    # --- LLM 调用结束 ---
+
+    return await save_chat_turn(db, chat_id, message.content, ai_response_content, summary_upto_order, background_tasks)
+
+@app.post("/chats/{chat_id}/message/stream", tags=["Chats"], dependencies=[Depends(auth.get_current_active_user)]) # 声明认证
+async def send_message_stream(chat_id: uuid.UUID, message: schemas.MessageCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """与 send_message 相同，但以 SSE (text/event-stream) 逐段返回 AI 回复，结束时发送保存后的消息"""
+    llm_request, summary_upto_order = await build_llm_request(chat_id, db, current_user)
+
+    async def event_stream():
+        chunks = []
+        async for chunk in llm_service.stream_qwen_response(user_message=message.content, **llm_request):
+            chunks.append(chunk)
+            yield f"data: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
+
+        # 请求作用域的会话在流开始前可能已经关闭，这里使用独立的会话保存
+        async with SessionLocal() as stream_db:
+            db_ai_message = await save_chat_turn(stream_db, chat_id, message.content, "".join(chunks), summary_upto_order, background_tasks)
+        yield f"event: done\ndata: {schemas.MessageResponse.model_validate(db_ai_message).model_dump_json()}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", background=background_tasks)
+
 @app.delete("/chats/bulk", status_code=status.HTTP_204_NO_CONTENT, tags=["Chats"], dependencies=[Depends(auth.get_current_active_user)])
-def delete_chats_bulk(chat_delete_request: schemas.ChatDeleteBulkRequest, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def delete_chats_bulk(chat_delete_request: schemas.ChatDeleteBulkRequest, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     try:
-        # 过滤掉不属于当前用户的聊天ID，防止越权删除
-        chats_to_delete = db.query(models.Chat).filter(
+        # 过滤掉不属于当前用户的聊天ID，防止越权删除 (只取 id，不加载整行)
+        result = await db.execute(select(models.Chat.id).where(
             models.Chat.id.in_(chat_delete_request.chat_ids),
             models.Chat.user_id == current_user.id
-        ).all()
+        ))
+        authorized_ids = result.scalars().all()
 
-        if not chats_to_delete:
+        if not authorized_ids:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No chats found for deletion or unauthorized")
 
-        for chat in chats_to_delete:
-            db.delete(chat)
-        db.commit()
+        # 每张表各一条 DELETE 语句；外键未声明 ON DELETE CASCADE，需要先删除消息
+        await db.execute(delete(models.Message).where(models.Message.chat_id.in_(authorized_ids)).execution_options(synchronize_session=False))
+        await db.execute(delete(models.Chat).where(models.Chat.id.in_(authorized_ids)).execution_options(synchronize_session=False))
+        await db.commit()
 
         return Response(status_code=status.HTTP_204_NO_CONTENT)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error during bulk chat deletion: {e}") # 打印详细错误信息
+        logger.exception("Error during bulk chat deletion: %s", e) # 记录详细错误信息
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error during bulk deletion: {e}")
 
 # --- 语音相关的 API 路由 ---
 
 @app.post("/audio/transcribe", tags=["Audio"], dependencies=[Depends(auth.get_current_active_user)])
-async def transcribe_audio(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def transcribe_audio(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     if not file.content_type.startswith("audio/"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only audio files are allowed")
 
-    # 将上传的文件保存到临时位置，或者直接传递文件内容（如果 API 支持）
-    # 这里为了简化，我们假设llm_service可以处理文件路径或字节流
-    # 实际上，你可能需要将文件保存到临时文件，然后将路径传递给llm_service
-    # 或者llm_service可以直接接收BytesIO对象
-
-    # 为了演示，我们将文件内容读取到内存中，然后假装它是一个文件路径
-    # 在生产环境中，建议使用 tempfile 模块创建临时文件
-    audio_content = await file.read()
-    # For `client.audio.transcriptions.create` to work with `file`, 
-    # we need to pass a file-like object directly.
-    # We'll create a BytesIO object to simulate an in-memory file.
-    audio_file_like = io.BytesIO(audio_content)
-    audio_file_like.name = file.filename # Add a name attribute for the API
-    
-    transcript_text = await llm_service.get_asr_transcript(audio_file_like) # 传递文件对象
+    # 直接传递 UploadFile 底层的 SpooledTemporaryFile，避免把整个音频读入内存再复制一份
+    transcript_text = await llm_service.get_asr_transcript(file.file)
     
     return {"transcript": transcript_text}
 
 @app.post("/audio/speak", tags=["Audio"], dependencies=[Depends(auth.get_current_active_user)])
-async def speak_text(text: schemas.TTSRequest, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def speak_text(text: schemas.TTSRequest, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     audio_content = await llm_service.get_tts_audio(text.input_text)
     
     if not audio_content:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to generate audio")
     
-    return StreamingResponse(io.BytesIO(audio_content), media_type="audio/mpeg") # 返回 mp3 格式的音频流
\ No newline at end of file
+    # 音频已完整解码在内存中，直接返回字节，由 Starlette 设置 Content-Length
+    return Response(content=audio_content, media_type="audio/mpeg") # 返回 mp3 格式的音频
\ No newline at end of file
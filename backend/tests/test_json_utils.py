@@ -0,0 +1,32 @@
+# tests/test_json_utils.py
+import base64
+
+from app.json_utils import find_json_string_field
+
+AUDIO = base64.b64encode(b"hello world").decode()
+
+def find(raw: bytes):
+    result = find_json_string_field(raw, b'"data"')
+    return None if result is None else bytes(result)
+
+def test_top_level_field():
+    raw = f'{{"reqid": "x", "data" : "{AUDIO}", "addition": {{"duration": "1"}}}}'.encode()
+    assert find(raw) == AUDIO.encode()
+    assert base64.b64decode(find_json_string_field(raw, b'"data"')) == b"hello world"
+
+def test_nested_field_is_skipped():
+    assert find(b'{"meta":{"data":"WFla"},"data":"QUJD"}') == b"QUJD"
+    assert find(b'{"items":[{"data":"WFla"}]}') is None
+
+def test_key_text_inside_string_values_is_ignored():
+    assert find(b'{"note":"\\"data\\":\\"WFla\\"","data":"QUJD"}') == b"QUJD"
+    assert find(b'{"note":"data","data":"QUJD"}') == b"QUJD"
+
+def test_escaped_value_falls_back():
+    assert find(b'{"data":"ab\\/cd"}') is None
+
+def test_missing_or_non_string_value():
+    assert find(b'{"code":400,"message":"bad request"}') is None
+    assert find(b'{"data":{"text":"hi"}}') is None
+    assert find(b'{"data":null}') is None
+    assert find(b'{"data":"QUJD') is None